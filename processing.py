@@ -0,0 +1,597 @@
+import fitz  # PyMuPDF
+import ahocorasick
+import easyocr
+import contextlib
+import math
+import numpy as np
+import os
+import re
+import tempfile
+from bisect import bisect_right
+from functools import lru_cache
+from PIL import Image
+
+# Recognizer batch size. CRAFT detection stacks every page of a call into one
+# tensor, so pages per call are capped separately: about 1.2 GB of activations
+# per page at the canvas size. Batching pages only pays off on a GPU
+OCR_BATCH_SIZE = 8
+OCR_GPU_PAGE_WINDOW = 2
+# PDF pages are rasterized at a modest DPI and CRAFT upscales them internally,
+# which keeps pixmaps a quarter of the size of a 300 DPI render
+OCR_DPI = 150
+OCR_MAG_RATIO = 2.0
+OCR_CANVAS_SIZE = 2560
+# PyMuPDF rendering + OCR stops scaling much beyond four page workers
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+# auto: OCR a PDF page unless it shows no images and its text layer is rich
+# and matched every pattern
+OCR_MODES = ('auto', 'always', 'never')
+TEXT_RICH_CHARS = 200
+
+def temp_path(suffix):
+    """Create an empty temp file and return its path; the caller removes it."""
+    with tempfile.NamedTemporaryFile(prefix='docshade_', suffix=suffix, delete=False) as f:
+        return f.name
+
+def remove_temp(path):
+    """Remove a temp file from temp_path, if it is still there."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+def detect_gpu_backend():
+    """Return "CUDA" or "ROCm" if torch can see a GPU, otherwise None."""
+    import torch
+    if not torch.cuda.is_available():
+        return None
+    # ROCm builds of torch expose AMD GPUs through the torch.cuda API
+    return "ROCm" if torch.version.hip else "CUDA"
+
+def disable_autograd():
+    # Inference only: drop autograd bookkeeping inside reader.readtext.
+    # Grad mode is thread-local, so this has to run on the thread doing OCR.
+    import torch
+    torch.set_grad_enabled(False)
+
+@lru_cache(maxsize=None)
+def load_easyocr_reader(lang='de', gpu=False):
+    # Cached per (lang, gpu) and per process, so every pool worker builds its
+    # reader once and toggling the GPU switch builds a separate one
+    # On CPU, int8 dynamic quantization of the detector and recognizer
+    # roughly doubles throughput; EasyOCR only applies it on the CPU path
+    return easyocr.Reader([lang], gpu=gpu, quantize=not gpu, cudnn_benchmark=True)
+
+def init_worker():
+    # Pool workers run OCR on their own main thread, and only on CPU. Loading
+    # the reader here pays its start-up cost once per worker, not per task
+    import torch
+    # torch defaults to one intra-op thread per core in every worker, so split
+    # the cores between them instead of oversubscribing the CPU
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // MAX_WORKERS))
+    disable_autograd()
+    load_easyocr_reader(gpu=False)
+
+def pixmap_to_array(pix):
+    # View the raw pixmap samples as an (h, w, n) array that EasyOCR accepts
+    # directly, instead of round-tripping through a PNG encode and decode
+    arr = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.alpha:
+        arr = arr[..., :-1]
+    if arr.shape[2] == 1:
+        # Grayscale goes in as a plain (h, w) image
+        arr = arr[..., 0]
+    return arr
+
+def ocr_images(reader, images):
+    """Run EasyOCR over several rasters, batching the ones that share a shape."""
+    # readtext_batched stacks its inputs into one tensor, so images have to be the
+    # same size; grouping by shape avoids resizing and remapping the boxes
+    by_shape = {}
+    for idx, img in enumerate(images):
+        by_shape.setdefault(img.shape, []).append(idx)
+
+    results = [None] * len(images)
+    for indices in by_shape.values():
+        batch = reader.readtext_batched([images[i] for i in indices], batch_size=OCR_BATCH_SIZE,
+                                        mag_ratio=OCR_MAG_RATIO, canvas_size=OCR_CANVAS_SIZE)
+        for idx, page_results in zip(indices, batch):
+            results[idx] = page_results
+    return results
+
+# Everything str.isalnum() rejects: \W is the complement of [alnum_] for str patterns
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+# Normalize function to remove separators for flexible matching
+def normalize_text(text):
+    # Remove separators, spaces and noise characters, keeping only alphanumeric
+    return _NON_ALNUM.sub('', text.lower())
+
+def find_normalized_spans(norm_text, word_ends, pattern_normalized):
+    """Yield the offset and the (first, last) word indices of each occurrence of a pattern.
+
+    norm_text is the concatenation of the normalized words and word_ends holds
+    the offset where each word ends in it.
+    """
+    start = norm_text.find(pattern_normalized)
+    while start >= 0:
+        end = start + len(pattern_normalized)
+        # From the first word ending after the start to the first word reaching the end
+        yield (start, np.searchsorted(word_ends, start, side='right'),
+               np.searchsorted(word_ends, end, side='left'))
+        start = norm_text.find(pattern_normalized, start + 1)
+
+def build_pattern_automaton(sensitive_patterns):
+    """Compile all patterns into one Aho-Corasick automaton over lowercased text."""
+    automaton = ahocorasick.Automaton()
+    for pattern in sensitive_patterns:
+        key = ' '.join(pattern.lower().split())
+        if key:
+            automaton.add_word(key, key)
+    automaton.make_automaton()
+    return automaton
+
+def word_char_rects(page, textpage):
+    """Map each (block, line, word) number of a page's words to its character boxes.
+
+    textpage must be the one the words were extracted from, so the numbering agrees.
+    """
+    char_rects = {}
+    for block in page.get_text("rawdict", textpage=textpage)["blocks"]:
+        for line_no, line in enumerate(block.get("lines", ())):
+            word_no = 0
+            current = []
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    if char["c"].isspace():
+                        if current:
+                            char_rects[(block["number"], line_no, word_no)] = current
+                            word_no += 1
+                            current = []
+                    else:
+                        current.append(fitz.Rect(char["bbox"]))
+            if current:
+                char_rects[(block["number"], line_no, word_no)] = current
+    return char_rects
+
+def _raw_offsets(piece, lo, hi):
+    # Map characters [lo, hi) of a word's normalized text back onto the word,
+    # past the separators and noise characters normalize_text dropped. A match
+    # reaching either end of the word takes the noise there with it
+    positions = [j for j, c in enumerate(piece) if c.isalnum()]
+    if not positions:
+        # A bare separator inside the match, e.g. a hyphen, goes entirely
+        return 0, len(piece)
+    lo = max(lo, 0)
+    hi = min(hi, len(positions))
+    return (positions[lo] if lo else 0), (positions[hi - 1] + 1 if hi < len(positions) else len(piece))
+
+def _word_part(word, piece, lo, hi, char_boxes):
+    # Rectangle of characters [lo, hi) of a word, so "max" leaves the rest of
+    # "maximum" alone. Without its character boxes the word goes whole
+    lo = max(lo, 0)
+    hi = min(hi, len(piece))
+    chars = char_boxes.get(tuple(word[5:8])) if char_boxes else None
+    # Lowercasing or extraction can change the length, and then offsets do not line up
+    if (lo == 0 and hi == len(piece)) or chars is None or len(chars) != len(piece):
+        return fitz.Rect(word[:4])
+    rect = fitz.Rect(chars[lo])
+    for char in chars[lo + 1:hi]:
+        rect |= char
+    return rect
+
+def _line_rects(words, rects):
+    # One rectangle per text line, so a match wrapping onto the next line
+    # does not blank out everything in between
+    lines = {}
+    for w, rect in zip(words, rects):
+        line = (w[5], w[6])
+        if line in lines:
+            lines[line] |= rect
+        else:
+            lines[line] = rect
+    return list(lines.values())
+
+def find_digital_redactions(words, automaton, char_rects=None):
+    """Find every pattern in a page's extracted words.
+
+    Returns the rectangles of the matched characters and the set of automaton
+    keys that were found. char_rects is called at most once, only if a match
+    covers part of a word, and should return word_char_rects for the page;
+    without it such words are redacted whole.
+    """
+    # Join the words with single spaces and remember where each one starts
+    starts = []
+    pieces = []
+    pos = 0
+    for w in words:
+        piece = w[4].lower()
+        starts.append(pos)
+        pieces.append(piece)
+        pos += len(piece) + 1
+    text = ' '.join(pieces)
+
+    # Every match as its words and the character range it covers in each
+    matches = []
+    found = set()
+    for end, key in automaton.iter(text):
+        found.add(key)
+        match_start = end - len(key) + 1
+        first = bisect_right(starts, match_start) - 1
+        last = bisect_right(starts, end) - 1
+        matches.append([(i, match_start - starts[i], end + 1 - starts[i]) for i in range(first, last + 1)])
+
+    # Patterns the automaton missed can still be present with other separators
+    # or hyphenated across a line break. Both disappear in the normalized word
+    # text, which is searched in memory instead of rescanning the page per pattern
+    missing = [key for key in automaton.keys() if key not in found]
+    if missing:
+        norm_words = [normalize_text(w[4]) for w in words]
+        word_lengths = np.array([len(n) for n in norm_words], dtype=np.int64)
+        word_ends = np.cumsum(word_lengths)
+        word_starts = (word_ends - word_lengths).tolist()
+        norm_text = ''.join(norm_words)
+        for key in missing:
+            pattern_normalized = normalize_text(key)
+            if not pattern_normalized:
+                continue
+            for match_start, first, last in find_normalized_spans(norm_text, word_ends, pattern_normalized):
+                found.add(key)
+                match_end = match_start + len(pattern_normalized)
+                matches.append([(i, *_raw_offsets(pieces[i], match_start - word_starts[i], match_end - word_starts[i]))
+                                for i in range(first, last + 1)])
+
+    # Character boxes cost a second extraction pass, so only fetch them when
+    # some match starts or ends inside a word
+    char_boxes = None
+    if char_rects is not None and any(lo > 0 or hi < len(pieces[i]) for match in matches for i, lo, hi in match):
+        char_boxes = char_rects()
+
+    rects = []
+    for match in matches:
+        rects.extend(_line_rects([words[i] for i, _, _ in match],
+                                 [_word_part(words[i], pieces[i], lo, hi, char_boxes) for i, lo, hi in match]))
+    return rects, found
+
+def find_ocr_redactions(results, sensitive_patterns, scale):
+    """Map EasyOCR results for one page to redaction rectangles in page coordinates."""
+    redactions = []
+    # Use a very low confidence threshold (>0.05) to catch difficult-to-read text like MRZ zones
+    detections = [(bbox, text.strip()) for (bbox, text, prob) in results if prob > 0.05 and text.strip()]
+
+    # Stack the (N, 4, 2) corner points and take every box's extent in four reductions
+    boxes = np.asarray([bbox for bbox, _ in detections], dtype=np.float32).reshape(-1, 4, 2)
+    lefts = boxes[..., 0].min(-1).tolist()
+    rights = boxes[..., 0].max(-1).tolist()
+    tops = boxes[..., 1].min(-1).tolist()
+    bottoms = boxes[..., 1].max(-1).tolist()
+
+    ocr_words = []
+    for (_, full_text), left, right, top, bottom in zip(detections, lefts, rights, tops, bottoms):
+        width = right - left
+        height = bottom - top
+        
+        # Split multi-word OCR results into individual words
+        words = full_text.split()
+        if len(words) > 1:
+            # Estimate word width per character
+            char_width = width / len(full_text)
+            current_pos = left
+            for word in words:
+                word_width = len(word) * char_width
+                ocr_words.append({
+                    'text': word,
+                    'left': current_pos,
+                    'top': top,
+                    'width': word_width,
+                    'height': height
+                })
+                current_pos += word_width + char_width  # Add space width
+        else:
+            ocr_words.append({
+                'text': full_text,
+                'left': left,
+                'top': top,
+                'width': width,
+                'height': height
+            })
+    
+    # Normalize every OCR word once. word_starts[k]/word_ends[k] are the offsets
+    # of word k in the combined text, so a match offset maps back to words by bisection
+    norm_words = [normalize_text(w['text']) for w in ocr_words]
+    word_lengths = np.array([len(n) for n in norm_words], dtype=np.int64)
+    word_ends = np.cumsum(word_lengths)
+    word_starts = word_ends - word_lengths
+    # Build a combined text of all OCR words for substring matching
+    all_ocr_normalized = ''.join(norm_words)
+    # Hash index of the words, so single-word hits are a lookup instead of a
+    # string comparison against every word for every pattern
+    word_index = {}
+    for i, word_normalized in enumerate(norm_words):
+        word_index.setdefault(word_normalized, []).append(i)
+
+    for pattern in sensitive_patterns:
+        pattern_normalized = normalize_text(pattern)
+        # Every kind of match below needs the pattern somewhere in the combined
+        # text, so one C-level substring check rules most patterns out early
+        if not pattern_normalized or pattern_normalized not in all_ocr_normalized:
+            continue
+        
+        # Check single word matches first
+        for i in word_index.get(pattern_normalized, ()):
+            w_data = ocr_words[i]
+            # Add 15% padding to the right to ensure complete redaction
+            padded_width = w_data['width'] * 1.15
+            rect_coords = (
+                int(w_data['left'] * scale),
+                int(w_data['top'] * scale),
+                int((w_data['left'] + padded_width) * scale),
+                int((w_data['top'] + w_data['height']) * scale)
+            )
+            redactions.append(rect_coords)
+
+        # Try to match across consecutive words (for patterns like "01 01 1990").
+        # A run from word i has to end exactly on a word boundary at
+        # word_starts[i] + len(pattern); bisecting the word ends finds that word
+        # for every i at once, and only those candidates get a string comparison
+        targets = word_starts + len(pattern_normalized)
+        run_ends = np.searchsorted(word_ends, targets, side='left')
+        on_boundary = word_ends[np.minimum(run_ends, len(norm_words) - 1)] == targets
+        candidates = np.flatnonzero((run_ends > np.arange(len(norm_words))) & (run_ends < len(norm_words)) & on_boundary)
+
+        for i in candidates.tolist():
+            start = word_starts[i]
+            if all_ocr_normalized[start:start + len(pattern_normalized)] == pattern_normalized:
+                # Redact all words in the sequence
+                word_list = ocr_words[i:run_ends[i] + 1]
+                min_left = min(w['left'] for w in word_list)
+                max_right = max(w['left'] + w['width'] for w in word_list)
+                min_top = min(w['top'] for w in word_list)
+                max_bottom = max(w['top'] + w['height'] for w in word_list)
+                
+                rect_coords = (
+                    int(min_left * scale),
+                    int(min_top * scale),
+                    int(max_right * scale),  # 5% padding
+                    int(max_bottom * scale)
+                )
+                redactions.append(rect_coords)
+        
+        # Fallback: substring matching if pattern not found as exact word matches
+        # This handles cases where OCR might split or merge characters differently
+        for _, first, last in find_normalized_spans(all_ocr_normalized, word_ends, pattern_normalized):
+            # Redact every word overlapping the match
+            words_to_redact = ocr_words[first:last + 1]
+            
+            min_left = min(w['left'] for w in words_to_redact)
+            max_right = max(w['left'] + w['width'] for w in words_to_redact)
+            min_top = min(w['top'] for w in words_to_redact)
+            max_bottom = max(w['top'] + w['height'] for w in words_to_redact)
+            
+            rect_coords = (
+                int(min_left * scale),
+                int(min_top * scale),
+                int(max_right * scale),
+                int(max_bottom * scale)
+            )
+            redactions.append(rect_coords)
+
+    return redactions
+
+def _iou(a, b):
+    width = min(a.x1, b.x1) - max(a.x0, b.x0)
+    height = min(a.y1, b.y1) - max(a.y0, b.y0)
+    if width <= 0 or height <= 0:
+        return 0.0
+    inter = width * height
+    return inter / (a.width * a.height + b.width * b.height - inter)
+
+def merge_rects(rects, min_iou=0.2):
+    """Fold rectangles overlapping by more than min_iou into their union."""
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r.y0, r.x0)):
+        rect = fitz.Rect(rect)
+        # A growing union can reach rectangles merged earlier, so repeat until stable
+        changed = True
+        while changed:
+            changed = False
+            for i, other in enumerate(merged):
+                if _iou(rect, other) > min_iou:
+                    rect |= merged.pop(i)
+                    changed = True
+                    break
+        merged.append(rect)
+    return merged
+
+def _process_pages(doc, sensitive_patterns, watermark_text, use_gpu=False, ocr_mode='auto'):
+    """Redact and watermark every page of an open PDF in place."""
+    if sensitive_patterns:
+        if ocr_mode != 'never':
+            reader = load_easyocr_reader(gpu=use_gpu)
+        scale = 72 / OCR_DPI
+        automaton = build_pattern_automaton(sensitive_patterns)
+
+    if watermark_text:
+        # Watermark geometry for every page in one vectorized pass
+        page_sizes = np.array([(page.rect.width, page.rect.height) for page in doc], dtype=float).reshape(-1, 2)
+        font_sizes = np.hypot(page_sizes[:, 0], page_sizes[:, 1]) * 0.05
+        centers = page_sizes / 2
+        text_starts = centers[:, 0] - len(watermark_text) * font_sizes * 0.2
+        # The rotation is the same on every page, so build it once
+        rotation = fitz.Matrix(45)
+
+    # Pages are handled in small windows so a GPU can detect a few at once; on
+    # CPU, batching gains nothing and each page gets its own OCR call
+    window = OCR_GPU_PAGE_WINDOW if use_gpu else 1
+    for batch_start in range(0, len(doc), window):
+        pages = [doc[i] for i in range(batch_start, min(batch_start + window, len(doc)))]
+
+        # Rectangles are buffered per page so overlapping hits from both stages
+        # can be merged before they become annotations
+        page_redactions = [[] for _ in pages]
+        ocr_indices = []
+
+        # 1. ROBUST REDACTION (Digital + OCR)
+        if sensitive_patterns:
+            # --- Stage 1: Digital Search (Fast and Precise) ---
+            for idx, (page, redactions) in enumerate(zip(pages, page_redactions)):
+                # One text page serves the words and, for partial-word hits, the character boxes
+                textpage = page.get_textpage()
+                words = page.get_text("words", textpage=textpage)
+                rects, found = find_digital_redactions(words, automaton, lambda: word_char_rects(page, textpage))
+                for rect in rects:
+                    if rect.height > 3:
+                        rect.y0 += 2
+                        rect.y1 -= 1
+                    redactions.append(rect)
+
+                # In auto mode a text-rich page whose text layer already produced
+                # every pattern skips OCR, unless it shows an image: a pasted scan,
+                # stamp or signature can hold another occurrence. get_image_info
+                # also sees inline images, which get_images does not list
+                covered = (sum(len(w[4]) for w in words) > TEXT_RICH_CHARS and len(found) == len(automaton)
+                           and not page.get_image_info())
+                if ocr_mode == 'always' or (ocr_mode == 'auto' and not covered):
+                    ocr_indices.append(idx)
+
+        # --- Stage 2: OCR Search (for Scanned/Image content) ---
+        if ocr_indices:
+            # EasyOCR works on grayscale anyway, so skip rendering the two extra channels
+            images = [pixmap_to_array(pages[idx].get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY, alpha=False)) for idx in ocr_indices]
+            ocr_results = ocr_images(reader, images)
+            del images
+
+            for idx, results in zip(ocr_indices, ocr_results):
+                page_redactions[idx].extend(fitz.Rect(rect_coords) for rect_coords in find_ocr_redactions(results, sensitive_patterns, scale))
+
+        for page, redactions in zip(pages, page_redactions):
+            # Pages without hits are left untouched instead of being re-rendered
+            if redactions:
+                for rect in merge_rects(redactions):
+                    page.add_redact_annot(rect, fill=(0, 0, 0))
+                page.apply_redactions()
+
+            # 2. ADAPTIVE WATERMARK
+            if watermark_text:
+                center_x, center_y = centers[page.number]
+                
+                page.insert_text(
+                    (text_starts[page.number], center_y),
+                    watermark_text,
+                    fontsize=font_sizes[page.number],
+                    color=(0.5, 0.5, 0.5),
+                    fill_opacity=0.5,
+                    morph=(fitz.Point(center_x, center_y), rotation)
+                )
+
+def _process_image(doc, sensitive_patterns, use_gpu=False):
+    """OCR-redact a single-page image document and return it as a PIL image."""
+    # The same raster feeds OCR and the output, so the image is rendered only once
+    pixels = pixmap_to_array(doc[0].get_pixmap(alpha=False))
+
+    if sensitive_patterns:
+        reader = load_easyocr_reader(gpu=use_gpu)
+        image_redactions = find_ocr_redactions(reader.readtext(pixels), sensitive_patterns, 1.0)
+        image_redactions = [tuple(int(v) for v in rect) for rect in merge_rects(map(fitz.Rect, image_redactions))]
+
+        # Apply redactions as one slice fill per rectangle on a writable copy
+        if image_redactions:
+            pixels = pixels.copy()
+            for x0, y0, x1, y1 in image_redactions:
+                # Inclusive of the far edge like ImageDraw.rectangle; OCR boxes can start off-image
+                pixels[max(y0, 0):y1 + 1, max(x0, 0):x1 + 1] = 0
+    return Image.fromarray(pixels)
+
+def _process_page_range(pdf_bytes, start, stop, sensitive_patterns, watermark_text, use_gpu=False, ocr_mode='auto'):
+    """Pool worker: process pages [start, stop) of a PDF and return the path of the result."""
+    doc = fitz.open(stream=pdf_bytes, filetype='pdf')
+    doc.select(list(range(start, stop)))
+    _process_pages(doc, sensitive_patterns, watermark_text, use_gpu, ocr_mode)
+    # Hand the pages back through a temp file rather than pickling the bytes
+    path = temp_path('.pdf')
+    try:
+        doc.save(path)
+    except BaseException:
+        remove_temp(path)
+        raise
+    doc.close()
+    return path
+
+def _can_split(doc):
+    """Whether a PDF's page ranges can be processed apart and merged back without loss."""
+    # insert_pdf carries pages over but not form fields or embedded files, and
+    # a link into another range would point nowhere after the merge
+    if doc.is_form_pdf or doc.embfile_count():
+        return False
+    # Bookmarks to named destinations need the name tree, which is not copied either
+    if any(entry[3].get('kind') == fitz.LINK_NAMED for entry in doc.get_toc(simple=False)):
+        return False
+    return not any(link['kind'] in (fitz.LINK_GOTO, fitz.LINK_NAMED) for page in doc for link in page.get_links())
+
+def _process_pdf_parallel(doc, pdf_bytes, sensitive_patterns, watermark_text, use_gpu, ocr_mode, executor):
+    """Split a PDF into contiguous page ranges, process them on the pool and merge the results."""
+    chunk = math.ceil(len(doc) / MAX_WORKERS)
+    futures = [
+        executor.submit(_process_page_range, pdf_bytes, start, min(start + chunk, len(doc)),
+                        sensitive_patterns, watermark_text, use_gpu, ocr_mode)
+        for start in range(0, len(doc), chunk)
+    ]
+
+    try:
+        merged = fitz.open()
+        for future in futures:
+            with fitz.open(future.result()) as part:
+                merged.insert_pdf(part)
+    finally:
+        # Also collect the parts of ranges that finished after another one failed
+        for future in futures:
+            if not future.cancel() and future.exception() is None:
+                os.remove(future.result())
+    # insert_pdf only copies pages, so carry over document-level data
+    merged.set_metadata(doc.metadata)
+    # The detailed TOC keeps each bookmark's link kind, target, zoom, colour,
+    # bold and collapse state, which the simple one drops
+    merged.set_toc(doc.get_toc(simple=False))
+    page_labels = doc.get_page_labels()
+    if page_labels:
+        merged.set_page_labels(page_labels)
+    doc.close()
+    return merged
+
+def process_file(file_content, file_name, sensitive_patterns, watermark_text, use_gpu=False, ocr_mode='auto', executor=None):
+    """Protect one uploaded file and return the path of a temp file holding the result.
+
+    The caller owns the returned file and is responsible for removing it.
+    """
+    file_ext = file_name.split('.')[-1].lower()
+    if file_ext == 'jpeg': file_ext = 'jpg'
+
+    doc = fitz.open(stream=file_content, filetype=file_ext)
+    is_pdf = file_ext == 'pdf'
+
+    if is_pdf:
+        # Multi-page PDFs are spread over the worker pool when one is given, it
+        # has more than one worker and splitting would not lose forms,
+        # attachments or cross-page links
+        if executor is not None and MAX_WORKERS > 1 and len(doc) > 1 and _can_split(doc):
+            doc = _process_pdf_parallel(doc, file_content, sensitive_patterns, watermark_text, use_gpu, ocr_mode, executor)
+        else:
+            _process_pages(doc, sensitive_patterns, watermark_text, use_gpu, ocr_mode)
+        output_path = temp_path('.pdf')
+    else:
+        img = _process_image(doc, sensitive_patterns, use_gpu)
+        output_path = temp_path('.png')
+
+    try:
+        if is_pdf:
+            # Written straight to disk. Images and fonts pass through as they are
+            # rather than being re-deflated; only the other streams get compressed
+            doc.save(output_path, garbage=3, deflate=True, deflate_images=False, deflate_fonts=False, clean=True)
+        else:
+            # Save as PNG; the fastest zlib level costs a little size but halves encode time
+            img.save(output_path, format="PNG", compress_level=1, optimize=False)
+    except BaseException:
+        # A partly written copy of the document must not stay behind
+        remove_temp(output_path)
+        raise
+
+    doc.close()
+    return output_path
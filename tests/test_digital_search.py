@@ -0,0 +1,50 @@
+import fitz  # PyMuPDF
+import pytest
+
+from processing import build_pattern_automaton, find_digital_redactions, word_char_rects
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Maximum Max Muster-", fontsize=12)
+    page.insert_text((72, 90), "mann, Hans 01.02.1990", fontsize=12)
+    yield page
+    doc.close()
+
+
+def redacted_text(page, rects):
+    for rect in rects:
+        page.add_redact_annot(rect)
+    page.apply_redactions()
+    return page.get_text("words")
+
+
+def test_find_digital_redactions_partial_word(page):
+    textpage = page.get_textpage()
+    words = page.get_text("words", textpage=textpage)
+    rects, found = find_digital_redactions(words, build_pattern_automaton(["max"]), lambda: word_char_rects(page, textpage))
+    assert found == {"max"}
+    assert len(rects) == 2
+    # Only the matched characters go, not the rest of the word
+    assert [w[4] for w in redacted_text(page, rects)] == ["imum", "Muster-", "mann,", "Hans", "01.02.1990"]
+
+
+def test_find_digital_redactions_hyphenated_and_separated(page):
+    textpage = page.get_textpage()
+    words = page.get_text("words", textpage=textpage)
+    automaton = build_pattern_automaton(["Mustermann", "0102", "missing"])
+    rects, found = find_digital_redactions(words, automaton, lambda: word_char_rects(page, textpage))
+    assert found == {"mustermann", "0102"}
+    # The hyphenated match spans two lines and gets one rectangle per line
+    assert len(rects) == 3
+    assert [w[4] for w in redacted_text(page, rects)] == ["Maximum", "Max", "Hans", ".1990"]
+
+
+def test_find_digital_redactions_without_char_rects(page):
+    words = page.get_text("words")
+    rects, found = find_digital_redactions(words, build_pattern_automaton(["max"]))
+    assert found == {"max"}
+    # Without character boxes, partially matched words are redacted whole
+    assert rects == [fitz.Rect(words[0][:4]), fitz.Rect(words[1][:4])]
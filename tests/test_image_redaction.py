@@ -0,0 +1,60 @@
+import io
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+import processing
+from processing import _process_image
+
+
+class FakeReader:
+    """Stands in for easyocr.Reader with fixed detections."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def readtext(self, image):
+        return self.results
+
+
+def image_doc(width=40, height=30):
+    buffer = io.BytesIO()
+    # At 72 DPI the page rendered by _process_image has the same pixel size
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG", dpi=(72, 72))
+    return fitz.open(stream=buffer.getvalue(), filetype="png")
+
+
+def redact(monkeypatch, results):
+    monkeypatch.setattr(processing, "load_easyocr_reader", lambda lang='de', gpu=False: FakeReader(results))
+    return np.asarray(_process_image(image_doc(), ["secret"], False))
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_fill_includes_far_edge(monkeypatch):
+    # 20 px wide plus 15% padding ends at x = 5 + 23 = 28
+    pixels = redact(monkeypatch, [(box(5, 4, 25, 12), "secret", 0.9)])
+    assert pixels.shape == (30, 40, 3)
+    assert (pixels[4:13, 5:29] == 0).all()
+    # Everything outside the rectangle, including the next row and column, stays white
+    assert (pixels[13, :] == 255).all()
+    assert (pixels[:, 29] == 255).all()
+    assert (pixels[3, :] == 255).all()
+    assert (pixels[:, 4] == 255).all()
+
+
+def test_fill_clamps_boxes_starting_off_image(monkeypatch):
+    # A negative start must not wrap around to the far side of the image
+    pixels = redact(monkeypatch, [(box(-6, -3, 14, 8), "secret", 0.9)])
+    # 20 px wide plus 15% padding ends at x = -6 + 23 = 17
+    assert (pixels[:9, :18] == 0).all()
+    assert (pixels[9:, :] == 255).all()
+    assert (pixels[:, 18:] == 255).all()
+
+
+def test_no_hits_leave_image_untouched(monkeypatch):
+    pixels = redact(monkeypatch, [(box(5, 4, 25, 12), "public", 0.9)])
+    assert (pixels == 255).all()
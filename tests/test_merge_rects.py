@@ -0,0 +1,20 @@
+import fitz  # PyMuPDF
+
+from processing import merge_rects
+
+
+def test_merge_rects():
+    rects = [fitz.Rect(0, 0, 10, 10), fitz.Rect(2, 2, 12, 12), fitz.Rect(50, 50, 60, 60)]
+    assert merge_rects(rects) == [fitz.Rect(0, 0, 12, 12), fitz.Rect(50, 50, 60, 60)]
+
+
+def test_merge_rects_keeps_slight_overlaps_apart():
+    rects = [fitz.Rect(0, 0, 10, 10), fitz.Rect(9, 0, 19, 10)]
+    assert merge_rects(rects) == rects
+
+
+def test_merge_rects_chains_through_growing_union():
+    # The last rectangle merges with the first, and only that union overlaps
+    # the second one enough to absorb it as well
+    rects = [fitz.Rect(0, 0, 10, 10), fitz.Rect(12, 0, 22, 10), fitz.Rect(5, 1, 17, 10)]
+    assert merge_rects(rects) == [fitz.Rect(0, 0, 22, 10)]
@@ -0,0 +1,126 @@
+import random
+
+from processing import find_ocr_redactions
+
+
+def baseline_ocr_redactions(results, sensitive_patterns, scale):
+    """The original per-word OCR matching loops, kept as the reference behaviour.
+
+    The substring fallback reports every occurrence rather than only the first,
+    as find_ocr_redactions has done since it moved to find_normalized_spans.
+    """
+    def normalize_text(text):
+        normalized = text.lower()
+        normalized = ''.join(c for c in normalized if c.isalnum() or c.isspace())
+        return normalized.replace(' ', '')
+
+    def rect_of(word_list):
+        return (
+            int(min(w['left'] for w in word_list) * scale),
+            int(min(w['top'] for w in word_list) * scale),
+            int(max(w['left'] + w['width'] for w in word_list) * scale),
+            int(max(w['top'] + w['height'] for w in word_list) * scale)
+        )
+
+    ocr_words = []
+    for (bbox, text, prob) in results:
+        if prob > 0.05 and text.strip():
+            xs = [point[0] for point in bbox]
+            ys = [point[1] for point in bbox]
+            left = min(xs)
+            top = min(ys)
+            width = max(xs) - left
+            height = max(ys) - top
+            full_text = text.strip()
+            words = full_text.split()
+            if len(words) > 1:
+                char_width = width / len(full_text)
+                current_pos = left
+                for word in words:
+                    word_width = len(word) * char_width
+                    ocr_words.append({'text': word, 'left': current_pos, 'top': top, 'width': word_width, 'height': height})
+                    current_pos += word_width + char_width
+            else:
+                ocr_words.append({'text': full_text, 'left': left, 'top': top, 'width': width, 'height': height})
+
+    redactions = []
+    for pattern in sensitive_patterns:
+        pattern_normalized = normalize_text(pattern)
+        all_ocr_normalized = ''.join(normalize_text(w['text']) for w in ocr_words)
+
+        for i in range(len(ocr_words)):
+            word_data = ocr_words[i]
+            word_normalized = normalize_text(word_data['text'])
+            if word_normalized == pattern_normalized:
+                padded_width = word_data['width'] * 1.15
+                redactions.append((
+                    int(word_data['left'] * scale),
+                    int(word_data['top'] * scale),
+                    int((word_data['left'] + padded_width) * scale),
+                    int((word_data['top'] + word_data['height']) * scale)
+                ))
+            else:
+                combined_text = word_normalized
+                j = i + 1
+                word_list = [word_data]
+                while j < len(ocr_words) and len(combined_text) < len(pattern_normalized):
+                    combined_text += normalize_text(ocr_words[j]['text'])
+                    word_list.append(ocr_words[j])
+                    j += 1
+                if combined_text == pattern_normalized and len(word_list) > 1:
+                    redactions.append(rect_of(word_list))
+
+        pattern_start_idx = all_ocr_normalized.find(pattern_normalized)
+        while pattern_start_idx >= 0:
+            pattern_end_idx = pattern_start_idx + len(pattern_normalized)
+            current_pos = 0
+            words_to_redact = []
+            for w in ocr_words:
+                w_end = current_pos + len(normalize_text(w['text']))
+                if not (w_end <= pattern_start_idx or current_pos >= pattern_end_idx):
+                    words_to_redact.append(w)
+                current_pos = w_end
+            redactions.append(rect_of(words_to_redact))
+            pattern_start_idx = all_ocr_normalized.find(pattern_normalized, pattern_start_idx + 1)
+    return redactions
+
+
+def random_results(rng):
+    # Short tokens over a tiny alphabet, so runs, substrings and empty
+    # normalized words (pure punctuation) all come up often
+    tokens = ['a', 'b', 'ab', 'ba', 'aab', '-', '.', 'a-b', 'b.', '12', '1', '2']
+    results = []
+    x = 0.0
+    for _ in range(rng.randint(0, 12)):
+        text = ' '.join(rng.choice(tokens) for _ in range(rng.randint(1, 3)))
+        width = rng.uniform(5, 80)
+        top = rng.uniform(0, 500)
+        bbox = [[x, top], [x + width, top], [x + width, top + 12], [x, top + 12]]
+        results.append((bbox, text, rng.choice([0.01, 0.5, 0.9])))
+        x += width + rng.uniform(0, 10)
+    return results
+
+
+def test_find_ocr_redactions_matches_baseline():
+    rng = random.Random(0)
+    # Patterns normalizing to nothing are skipped on purpose and left out here
+    patterns = ['a', 'ab', 'abab', 'aba', 'b a', '12', '1-2', 'a.b.a', 'bb', 'aabab']
+    for _ in range(2000):
+        results = random_results(rng)
+        chosen = rng.sample(patterns, rng.randint(1, 3))
+        scale = rng.choice([1.0, 72 / 150])
+        assert sorted(find_ocr_redactions(results, chosen, scale)) == sorted(baseline_ocr_redactions(results, chosen, scale))
+
+
+def test_find_ocr_redactions_multi_word_run():
+    results = [
+        ([[0, 0], [20, 0], [20, 10], [0, 10]], '01', 0.9),
+        ([[25, 0], [45, 0], [45, 10], [25, 10]], '01', 0.9),
+        ([[50, 0], [90, 0], [90, 10], [50, 10]], '1990', 0.9),
+    ]
+    assert (0, 0, 90, 10) in find_ocr_redactions(results, ['01.01.1990'], 1.0)
+
+
+def test_find_ocr_redactions_ignores_low_confidence():
+    results = [([[0, 0], [20, 0], [20, 10], [0, 10]], 'secret', 0.01)]
+    assert find_ocr_redactions(results, ['secret'], 1.0) == []
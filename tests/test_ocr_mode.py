@@ -0,0 +1,91 @@
+import fitz  # PyMuPDF
+import pytest
+
+import processing
+from processing import TEXT_RICH_CHARS, _process_pages
+
+FILLER = "Rental agreement between the parties named below. " * 6
+
+
+class FakeReader:
+    """Stands in for easyocr.Reader and records which pages were OCR'd."""
+
+    def __init__(self):
+        self.images = []
+
+    def readtext_batched(self, images, **kwargs):
+        self.images.extend(images)
+        return [[] for _ in images]
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    reader = FakeReader()
+    monkeypatch.setattr(processing, "load_easyocr_reader", lambda lang='de', gpu=False: reader)
+    return reader
+
+
+def make_page(doc, text, image=False):
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(72, 72, 520, 400), text, fontsize=10)
+    if image:
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20), False)
+        page.insert_image(fitz.Rect(72, 500, 172, 600), pixmap=pix)
+    return page
+
+
+def ocr_pages(ocr_mode, *pages):
+    # One page per (text, image) pair, processed in the given OCR mode
+    doc = fitz.open()
+    for text, image in pages:
+        make_page(doc, text, image)
+    _process_pages(doc, ["Mustermann", "DE12345"], "", ocr_mode=ocr_mode)
+    return doc
+
+
+def test_filler_is_text_rich():
+    # The skip tests below rely on the filler alone clearing the threshold
+    assert len(FILLER.replace(" ", "")) > TEXT_RICH_CHARS
+
+
+def test_auto_skips_rich_fully_matched_page(reader):
+    ocr_pages("auto", (FILLER + "Max Mustermann, IBAN DE12345", False))
+    assert reader.images == []
+
+
+def test_auto_ocrs_page_with_image(reader):
+    # The image could hold another occurrence the text layer cannot see
+    ocr_pages("auto", (FILLER + "Max Mustermann, IBAN DE12345", True))
+    assert len(reader.images) == 1
+
+
+def test_auto_ocrs_page_missing_a_pattern(reader):
+    ocr_pages("auto", (FILLER + "Max Mustermann", False))
+    assert len(reader.images) == 1
+
+
+def test_auto_ocrs_page_with_little_text(reader):
+    ocr_pages("auto", ("Max Mustermann, IBAN DE12345", False))
+    assert len(reader.images) == 1
+
+
+def test_auto_decides_per_page(reader):
+    ocr_pages("auto",
+              (FILLER + "Max Mustermann, IBAN DE12345", False),
+              (FILLER + "Max Mustermann, IBAN DE12345", True),
+              (FILLER + "Max Mustermann, IBAN DE12345", False))
+    assert len(reader.images) == 1
+
+
+def test_always_ocrs_every_page(reader):
+    ocr_pages("always", (FILLER + "Max Mustermann, IBAN DE12345", False), ("nothing here", False))
+    assert len(reader.images) == 2
+
+
+def test_never_skips_ocr_but_redacts_text_layer(monkeypatch):
+    def no_reader(*args, **kwargs):
+        raise AssertionError("never mode must not load the OCR model")
+
+    monkeypatch.setattr(processing, "load_easyocr_reader", no_reader)
+    doc = ocr_pages("never", ("Max Mustermann, IBAN DE12345", True))
+    assert "Mustermann" not in doc[0].get_text()
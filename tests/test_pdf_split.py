@@ -0,0 +1,121 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+import pytest
+
+import processing
+from processing import _can_split, _process_pdf_parallel, process_file
+
+
+@pytest.fixture(autouse=True)
+def isolated_temp_dir(tmp_path, monkeypatch):
+    # Temp files land in tmp_path, so tests can check that none are left behind
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    # Split into three ranges regardless of the host's core count
+    monkeypatch.setattr(processing, "MAX_WORKERS", 3)
+    return tmp_path
+
+
+@pytest.fixture
+def executor():
+    # Same submit/future interface as the process pool, without spawning workers
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        yield executor
+
+
+def make_pdf(pages=6):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"page {i}", fontsize=12)
+    doc.set_metadata({"title": "Lease", "author": "Landlord"})
+    doc.set_page_labels([{"startpage": 0, "prefix": "P-", "style": "D", "firstpagenum": 1}])
+    doc.set_toc([
+        [1, "Start", 1, {"kind": fitz.LINK_GOTO, "page": 0, "bold": True, "color": (1, 0, 0)}],
+        [2, "Terms", 5],
+        [1, "Website", -1, {"kind": fitz.LINK_URI, "uri": "https://example.org"}],
+    ])
+    return fitz.open("pdf", doc.tobytes())
+
+
+def toc_details(doc):
+    # The per-entry fields a reader sees; xrefs differ between documents
+    keys = ("kind", "page", "uri", "bold", "color")
+    return [(level, title, page, {k: v for k, v in info.items() if k in keys})
+            for level, title, page, info in doc.get_toc(simple=False)]
+
+
+def test_split_keeps_document_data(executor, isolated_temp_dir):
+    doc = make_pdf()
+    expected_toc = toc_details(doc)
+    merged = _process_pdf_parallel(doc, doc.tobytes(), [], "WATERMARK", False, "never", executor)
+
+    assert len(merged) == 6
+    assert [page.get_text().split()[:2] for page in merged] == [["page", str(i)] for i in range(6)]
+    assert all("WATERMARK" in page.get_text() for page in merged)
+    assert merged[4].get_label() == "P-5"
+    assert merged.metadata["title"] == "Lease"
+    assert merged.metadata["author"] == "Landlord"
+    assert toc_details(merged) == expected_toc
+    # The part files of every range are gone once merged
+    assert os.listdir(isolated_temp_dir) == []
+
+
+def test_split_removes_parts_when_a_range_fails(executor, isolated_temp_dir, monkeypatch):
+    process_page_range = processing._process_page_range
+
+    def fail_first_range(pdf_bytes, start, *args):
+        if start == 0:
+            raise RuntimeError("range failed")
+        return process_page_range(pdf_bytes, start, *args)
+
+    monkeypatch.setattr(processing, "_process_page_range", fail_first_range)
+    doc = make_pdf()
+    with pytest.raises(RuntimeError, match="range failed"):
+        _process_pdf_parallel(doc, doc.tobytes(), [], "", False, "never", executor)
+    assert os.listdir(isolated_temp_dir) == []
+
+
+def test_can_split_plain_pdf():
+    doc = make_pdf()
+    # External links survive the merge
+    doc[0].insert_link({"kind": fitz.LINK_URI, "from": fitz.Rect(72, 60, 140, 80), "uri": "https://example.org"})
+    assert _can_split(doc)
+
+
+def test_can_split_rejects_internal_links():
+    doc = make_pdf()
+    doc[0].insert_link({"kind": fitz.LINK_GOTO, "from": fitz.Rect(72, 60, 140, 80), "page": 5})
+    assert not _can_split(doc)
+
+
+def test_can_split_rejects_forms():
+    doc = make_pdf()
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = "tenant"
+    widget.rect = fitz.Rect(72, 100, 200, 120)
+    doc[2].add_widget(widget)
+    assert not _can_split(doc)
+
+
+def test_can_split_rejects_embedded_files():
+    doc = make_pdf()
+    doc.embfile_add("contract.txt", b"attachment")
+    assert not _can_split(doc)
+
+
+def test_process_file_keeps_forms_in_process(executor, isolated_temp_dir):
+    doc = make_pdf()
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = "tenant"
+    widget.rect = fitz.Rect(72, 100, 200, 120)
+    doc[4].add_widget(widget)
+
+    output_path = process_file(doc.tobytes(), "lease.pdf", [], "WATERMARK", ocr_mode="never", executor=executor)
+    with fitz.open(output_path) as result:
+        assert [w.field_name for w in result[4].widgets()] == ["tenant"]
+        assert result[4].get_label() == "P-5"
+    assert os.listdir(isolated_temp_dir) == [os.path.basename(output_path)]